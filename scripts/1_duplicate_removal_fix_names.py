@@ -1,57 +1,79 @@
 import os
-import hashlib
 import re
-from PyPDF2 import PdfReader
+import mmap
+import hashlib
+import blake3
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import pypdfium2 as pdfium  # pdfium C++ bindings for fast metadata and text access
 
 # Configuration
 FOLDER_PATH = r"C:\Users\Georg\Projects\Data_Processing\data\A_Collected"
 PROHIBITED_SUBSTRINGS = {'https', 'www', 'untitled', 'arxiv'}
-HASH_FUNCTION = 'sha256'
+HASH_READ_SIZE = 1 << 20  # 1 MiB reads keep per-call overhead out of the hash loop (Python < 3.11)
 
-def read_initial_bytes(file_path, num_bytes=1024):
+def compute_prefix_hash(file_path, file_size, num_bytes=1024):
+    # 16-byte digest of the initial bytes, used as a compact grouping key
+    length = min(num_bytes, file_size)
+    if not length:
+        return b''  # Empty files cannot be memory-mapped
     try:
-        with open(file_path, 'rb') as f:
-            return f.read(num_bytes)
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as prefix:
+            return blake3.blake3(prefix).digest(length=16)
     except Exception as e:
         print(f"Error reading initial bytes of {file_path}: {e}")
         return b''
 
-def compute_hash(file_path, hash_function='sha256'):
+def new_hasher():
+    # Single-threaded BLAKE3 (still SIMD): each pool process hashes one file at a time and the
+    # pool already covers every core, so per-hasher thread pools would only oversubscribe the CPU
+    return blake3.blake3()
+
+def compute_hash(file_path):
     try:
-        hash_func = hashlib.new(hash_function)
-        with open(file_path, 'rb') as f:
-            while chunk := f.read(8192):
+        with open(file_path, 'rb', buffering=0) as f:
+            if hasattr(os, 'posix_fadvise'):
+                # Hint sequential access so the kernel reads ahead aggressively
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            if hasattr(hashlib, 'file_digest'):
+                # Python 3.11+: reads into one reusable buffer, no per-chunk allocations
+                return hashlib.file_digest(f, new_hasher).hexdigest()
+            hash_func = new_hasher()
+            while chunk := f.read(HASH_READ_SIZE):
                 hash_func.update(chunk)
-        return hash_func.hexdigest()
+            return hash_func.hexdigest()
     except Exception as e:
         print(f"Error computing hash for {file_path}: {e}")
         return None
 
 def extract_title(file_path):
     try:
-        reader = PdfReader(file_path)
-        # Attempt to get title from metadata
-        if reader.metadata and reader.metadata.title:
-            title = reader.metadata.title
-        else:
-            # Fallback: extract text from first page
-            if len(reader.pages) > 0:
-                first_page = reader.pages[0]
-                text = first_page.extract_text()
-                if text:
-                    # Use the first non-empty line as title
-                    lines = text.split('\n')
-                    for line in lines:
-                        clean_line = line.strip()
-                        if clean_line:
-                            title = clean_line
-                            break
+        pdf = pdfium.PdfDocument(file_path)
+        try:
+            # Attempt to get title from metadata
+            metadata_title = pdf.get_metadata_dict().get('Title', '')
+            if metadata_title:
+                title = metadata_title
+            else:
+                # Fallback: extract text from first page
+                if len(pdf) > 0:
+                    text = pdf[0].get_textpage().get_text_range()
+                    if text:
+                        # Use the first non-empty line as title
+                        lines = text.splitlines()
+                        for line in lines:
+                            clean_line = line.strip()
+                            if clean_line:
+                                title = clean_line
+                                break
+                        else:
+                            title = "unknown_title"
                     else:
                         title = "unknown_title"
                 else:
                     title = "unknown_title"
-            else:
-                title = "unknown_title"
+        finally:
+            pdf.close()
         
         # Clean the title
         title = title.lower()
@@ -88,37 +110,54 @@ def assign_title(file_path, existing_titles):
     return title
 
 def main():
-    file_size_dict = {}
     # Step 1: Group files by size
-    for filename in os.listdir(FOLDER_PATH):
-        if filename.lower().endswith('.pdf'):
-            file_path = os.path.join(FOLDER_PATH, filename)
-            try:
-                size = os.path.getsize(file_path)
-                file_size_dict.setdefault(size, []).append(file_path)
-            except Exception as e:
-                print(f"Error getting size for {file_path}: {e}")
-
-    potential_duplicates = []
+    paths = []
+    sizes = []
+    with os.scandir(FOLDER_PATH) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith('.pdf'):
+                try:
+                    sizes.append(entry.stat().st_size)
+                    paths.append(entry.path)
+                except Exception as e:
+                    print(f"Error getting size for {entry.path}: {e}")
+
+    # Sort once and split at size changes; the stable sort keeps directory order within a bucket
+    file_size_dict = {}
+    if paths:
+        sizes = np.array(sizes, dtype=np.int64)
+        order = np.argsort(sizes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(sizes[order])) + 1
+        for bucket in np.split(order, boundaries):
+            file_size_dict[int(sizes[bucket[0]])] = [paths[i] for i in bucket]
+
     exact_duplicates = []
 
-    # Step 2: Identify potential duplicates by initial bytes
+    # Step 2: Identify potential duplicates by size and initial bytes
+    # Files with a unique (size, prefix) key cannot be exact duplicates
+    prefix_groups = {}
     for size, files in file_size_dict.items():
-        if len(files) > 1:
-            initial_contents = {}
-            for file in files:
-                content = read_initial_bytes(file)
-                if content in initial_contents:
-                    potential_duplicates.append((file, initial_contents[content]))
-                else:
-                    initial_contents[content] = file
+        if len(files) == 1:
+            prefix_groups[(size, None)] = files
+            continue
+        for file in files:
+            prefix_groups.setdefault((size, compute_prefix_hash(file, size)), []).append(file)
 
     # Step 3: Identify exact duplicates by full hash
-    for size, files in file_size_dict.items():
+    # Only potential duplicates are fully hashed, each exactly once across a process pool;
+    # Step 5 reuses the cached digests
+    candidate_files = [file for files in prefix_groups.values() if len(files) > 1 for file in files]
+    digest_cache = {}
+    if candidate_files:  # No potential duplicates, no pool to start
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            digests = executor.map(compute_hash, candidate_files, chunksize=8)
+            digest_cache = {file: file_hash for file, file_hash in zip(candidate_files, digests) if file_hash}
+
+    for files in prefix_groups.values():
         if len(files) > 1:
             hash_dict = {}
             for file in files:
-                file_hash = compute_hash(file, HASH_FUNCTION)
+                file_hash = digest_cache.get(file)
                 if not file_hash:
                     continue  # Skip files with hash computation issues
                 if file_hash in hash_dict:
@@ -138,14 +177,14 @@ def main():
     # Step 5: Assign titles to unique files
     # Rebuild the list of unique files after removal
     unique_files = []
-    for size, files in file_size_dict.items():
+    for files in prefix_groups.values():
         if len(files) == 1:
             unique_files.append(files[0])
         else:
             # From duplicates, keep only one file
             hashes = {}
             for file in files:
-                file_hash = compute_hash(file, HASH_FUNCTION)
+                file_hash = digest_cache.get(file)
                 if not file_hash:
                     continue
                 if file_hash not in hashes:
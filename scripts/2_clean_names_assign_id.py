@@ -1,7 +1,9 @@
 import os
 import fitz  # PyMuPDF
+import pikepdf  # Lazy loader for metadata-only reads
 import random
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 # Paths (adjust if necessary)
 pdf_directory = r"C:\Users\Georg\Projects\Data_Processing\data\A_Collected"
@@ -14,20 +16,32 @@ if os.path.exists(unique_ids_log_path):
 else:
     used_ids = set()
 
-def generate_unique_id(used_ids):
-    while True:
-        unique_id = str(random.randint(100000, 999999))
-        if unique_id not in used_ids:
-            used_ids.add(unique_id)
-            with open(unique_ids_log_path, 'a') as f:
-                f.write(unique_id + '\n')
-            return unique_id
+def reserve_unique_ids(used_ids, count):
+    # Draw all IDs at once from the unused 6-digit range instead of rejection sampling per file
+    taken = {int(unique_id) for unique_id in used_ids if unique_id.isdigit()}
+    available = sorted(set(range(100000, 1000000)) - taken)
+    unique_ids = [str(unique_id) for unique_id in random.sample(available, k=count)]
+    used_ids.update(unique_ids)
+    return unique_ids
+
+def read_metadata_title(pdf_path):
+    # pikepdf only reads the trailer and xref to reach the document info, not the page content
+    try:
+        with pikepdf.open(pdf_path) as pdf:
+            return str(pdf.docinfo.get('/Title', '')).strip()
+    except Exception:
+        return ''
 
 def extract_title(pdf_path):
     try:
+        # 1. Try to get the title from PDF metadata without a full PyMuPDF parse
+        metadata_title = read_metadata_title(pdf_path)
+        if len(metadata_title) > 5:
+            return metadata_title
+
         doc = fitz.open(pdf_path)
 
-        # 1. Try to get the title from PDF metadata
+        # PyMuPDF can still read metadata of files pikepdf rejects (e.g. encrypted ones)
         metadata_title = doc.metadata.get('title', '').strip()
         if metadata_title and len(metadata_title) > 5:
             doc.close()
@@ -88,11 +102,10 @@ def clean_title(title):
     cleaned_title = '_'.join(cleaned_words)
     return cleaned_title
 
-def rename_pdf(pdf_path):
+def rename_pdf(pdf_path, unique_id):
     original_filename = os.path.basename(pdf_path)
     title = extract_title(pdf_path)
     cleaned_title = clean_title(title)
-    unique_id = generate_unique_id(used_ids)
     new_filename = f"{cleaned_title} [{unique_id}].pdf"
     new_path = os.path.join(os.path.dirname(pdf_path), new_filename)
     try:
@@ -102,10 +115,20 @@ def rename_pdf(pdf_path):
         print(f"Error renaming {pdf_path}: {e}")
 
 def main():
-    for filename in os.listdir(pdf_directory):
-        if filename.lower().endswith('.pdf'):
-            pdf_path = os.path.join(pdf_directory, filename)
-            rename_pdf(pdf_path)
+    # Collect paths before renaming so renamed files are not picked up again
+    with os.scandir(pdf_directory) as entries:
+        pdf_paths = [entry.path for entry in entries if entry.name.lower().endswith('.pdf')]
+
+    unique_ids = reserve_unique_ids(used_ids, len(pdf_paths))
+
+    # Log all reserved IDs through one buffered handle before any worker starts
+    with open(unique_ids_log_path, 'a', buffering=1 << 16) as log_file:
+        log_file.writelines(unique_id + '\n' for unique_id in unique_ids)
+
+    # Each worker gets its pre-reserved ID, so no ID state is shared between processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for _ in executor.map(rename_pdf, pdf_paths, unique_ids, chunksize=8):
+            pass
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,10 @@
 import os
+import csv
 import logging
 import pytesseract  # Using pytesseract for OCR
-import fitz  # PyMuPDF for image and table extraction
+import fitz  # PyMuPDF for text, image and table extraction
 from multiprocessing import Pool, cpu_count
 import re
-import tabula  # Importing tabula-py
 import time
 import psutil  # For memory monitoring
 import cv2
@@ -64,10 +64,10 @@ def retry(function, retries=3, wait_time=5):
     logging.error(f"All {retries} attempts failed.")
     return False
 
-def extract_text_from_pdf(pdf_path, output_path):
-    return retry(lambda: _extract_text(pdf_path, output_path))
+def extract_text_from_pdf(doc, pdf_path, output_path):
+    return retry(lambda: _extract_text(doc, pdf_path, output_path))
 
-def _extract_text(pdf_path, output_path):
+def _extract_text(doc, pdf_path, output_path):
     try:
         logging.info(f"Starting text extraction for {pdf_path}")
         log_memory_usage()
@@ -75,8 +75,9 @@ def _extract_text(pdf_path, output_path):
         tesseract_config = '--oem 1 --psm 6'  # LSTM OCR engine with page segmentation for block of text
 
         try:
-            # First attempt: Try extracting text directly using PyMuPDF
-            doc = fitz.open(pdf_path)
+            # First attempt: Try extracting text directly using the shared PyMuPDF document
+            if doc is None:
+                raise RuntimeError("PyMuPDF could not open the document")
             full_text = "\n".join([page.get_text("text") for page in doc])
 
             # If direct extraction fails (e.g., no text is found), fallback to OCR
@@ -84,8 +85,11 @@ def _extract_text(pdf_path, output_path):
                 for page_num in range(len(doc)):
                     page = doc.load_page(page_num)
                     pix = page.get_pixmap()
-                    img = np.frombuffer(pix.tobytes(), np.uint8)  # Direct in-memory pass to avoid file I/O
-                    text = pytesseract.image_to_string(cv2.imdecode(img, cv2.IMREAD_COLOR), config=tesseract_config)
+                    # Wrap the raw pixel samples directly instead of a PNG encode/decode round-trip
+                    img = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width, pix.n)
+                    if pix.n == 4:
+                        img = img[..., :3]  # Drop the alpha channel, Tesseract takes RGB as-is
+                    text = pytesseract.image_to_string(img, config=tesseract_config)
                     full_text += text + "\n"
             # Save extracted text
             with open(output_path, 'w', encoding='utf-8') as f:
@@ -94,13 +98,24 @@ def _extract_text(pdf_path, output_path):
         except Exception as e:
             logging.error(f"Failed with PyMuPDF. Trying PDFPlumber for {pdf_path}: {e}")
             # Fallback to pdfplumber for text extraction
+            temp_path = output_path + ".tmp"
             try:
-                with pdfplumber.open(pdf_path) as pdf:
-                    full_text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(full_text)
+                # Stream page by page, extracting each page's text only once, into a temporary file
+                # that only replaces the output once every page succeeded
+                with pdfplumber.open(pdf_path) as pdf, open(temp_path, 'w', encoding='utf-8') as f:
+                    separator = ""
+                    for page in pdf.pages:
+                        page_text = page.extract_text()
+                        if page_text:
+                            f.write(separator)
+                            f.write(page_text)
+                            separator = "\n"
+                os.replace(temp_path, output_path)
             except Exception as e:
                 logging.error(f"Failed text extraction with both methods: {e}")
+                # Leave no empty or partial text behind for the later stages to pick up
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
                 return False
 
         log_memory_usage()
@@ -108,15 +123,13 @@ def _extract_text(pdf_path, output_path):
     except Exception as e:
         logging.error(f"Failed to extract text from {pdf_path}: {e}")
         return False
-    finally:
-        if 'doc' in locals():
-            doc.close()
     return True
 
-def extract_images_tables(pdf_path, base_filename, unique_id):
+def extract_images_tables(doc, pdf_path, base_filename, unique_id):
     try:
         logging.info(f"Extracting images from {pdf_path}")
-        doc = fitz.open(pdf_path)
+        if doc is None:
+            raise RuntimeError("PyMuPDF could not open the document")
 
         for page_num in range(len(doc)):
             page = doc.load_page(page_num)
@@ -136,15 +149,17 @@ def extract_images_tables(pdf_path, base_filename, unique_id):
                 else:
                     logging.info(f"Skipped irrelevant image on page {page_num+1} of {pdf_path}")
 
+        # PyMuPDF's table finder reuses the open document instead of parsing the PDF again
         logging.info(f"Extracting tables from {pdf_path}")
-        tables = tabula.read_pdf(pdf_path, pages='all', multiple_tables=True, lattice=True)
-        for i, table in enumerate(tables):
-            table_filename = f"{base_filename} [{unique_id}]_table_{i+1}.csv"
-            table_path = os.path.join(TABLES_OUTPUT_DIR, table_filename)
-            table.to_csv(table_path, index=False)
-            logging.info(f"Extracted table to {table_path}")
-
-        doc.close()
+        table_count = 0
+        for page in doc:
+            for table in page.find_tables().tables:
+                table_count += 1
+                table_filename = f"{base_filename} [{unique_id}]_table_{table_count}.csv"
+                table_path = os.path.join(TABLES_OUTPUT_DIR, table_filename)
+                with open(table_path, 'w', encoding='utf-8', newline='') as table_file:
+                    csv.writer(table_file).writerows(table.extract())
+                logging.info(f"Extracted table to {table_path}")
     except Exception as e:
         logging.error(f"Failed to extract images/tables from {pdf_path}: {e}")
         return False
@@ -153,18 +168,24 @@ def extract_images_tables(pdf_path, base_filename, unique_id):
 
 # Added compute_colorfulness function
 def compute_colorfulness(image):
-    # Split the image into its respective RGB components
-    (B, G, R) = cv2.split(image.astype("float"))
+    # Index the BGR channels directly instead of cv2.split + a full-image float copy
+    B = image[..., 0].astype(np.float32)
+    G = image[..., 1].astype(np.float32)
+    R = image[..., 2].astype(np.float32)
 
-    # Compute rg = R - G
-    rg = np.absolute(R - G)
+    # Compute rg = |R - G|
+    rg = np.subtract(R, G)
+    np.absolute(rg, out=rg)
 
-    # Compute yb = 0.5 * (R + G) - B
-    yb = np.absolute(0.5 * (R + G) - B)
+    # Compute yb = |0.5 * (R + G) - B|, reusing R's buffer
+    yb = np.add(R, G, out=R)
+    yb *= 0.5
+    yb -= B
+    np.absolute(yb, out=yb)
 
-    # Compute the mean and standard deviation of both 'rg' and 'yb'
-    (rbMean, rbStd) = (np.mean(rg), np.std(rg))
-    (ybMean, ybStd) = (np.mean(yb), np.std(yb))
+    # Compute the mean and standard deviation of both 'rg' and 'yb' in one SIMD pass each
+    (rbMean, rbStd) = (value.item() for value in cv2.meanStdDev(rg))
+    (ybMean, ybStd) = (value.item() for value in cv2.meanStdDev(yb))
 
     # Combine the mean and standard deviations
     stdRoot = np.sqrt((rbStd ** 2) + (ybStd ** 2))
@@ -173,6 +194,26 @@ def compute_colorfulness(image):
     # Compute the colorfulness metric and return it
     return stdRoot + (0.3 * meanRoot)
 
+# Thresholds for the cheap text-image heuristic used before falling back to OCR
+COLORFULNESS_THRESHOLD = 10  # Below this an image may be a scanned block of text
+CONFIDENT_COLORFULNESS = 8  # Below this the edge heuristic alone decides
+TEXT_EDGE_RATIO_RANGE = (0.03, 0.15)  # Canny edge density typical of printed text
+PAGE_MIN_SIDE = 400  # Minimum side in pixels for an image to count as a page
+PAGE_ASPECT_RANGE = (1.2, 1.6)  # Long/short side ratio of common page formats
+
+def compute_edge_ratio(img):
+    # Fraction of pixels on a Canny edge
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 50, 150)
+    return cv2.countNonZero(edges) / edges.size
+
+def looks_like_page(img):
+    height, width = img.shape[:2]
+    short_side, long_side = sorted((height, width))
+    if short_side < PAGE_MIN_SIDE:
+        return False
+    return PAGE_ASPECT_RANGE[0] <= long_side / short_side <= PAGE_ASPECT_RANGE[1]
+
 # Adjusted image_contains_relevant_content function
 def image_contains_relevant_content(image_bytes):
     np_arr = np.frombuffer(image_bytes, np.uint8)
@@ -181,25 +222,32 @@ def image_contains_relevant_content(image_bytes):
     # Compute colorfulness
     colorfulness = compute_colorfulness(img)
 
-    if colorfulness < 10:
-        # Low colorfulness, possibly text image
-        # Convert image to RGB (pytesseract expects RGB)
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        # Use Tesseract to detect text in the image
-        custom_config = '--oem 3 --psm 6'  # LSTM OCR engine, assume a single uniform block of text
-        data = pytesseract.image_to_data(img_rgb, output_type=pytesseract.Output.DICT, config=custom_config)
-        num_words = len([word for word in data['text'] if word.strip() != ''])
-
-        # If significant text is detected, consider it as text content and skip the image
-        if num_words > 10:
-            return False  # Skip image containing text content
-        else:
-            return True  # Keep image
-    else:
+    if colorfulness >= COLORFULNESS_THRESHOLD:
         # Image is colorful, likely to be a picture
         return True
 
+    # Low colorfulness, possibly text image
+    # Try the cheap edge-density heuristic before paying for OCR
+    if colorfulness < CONFIDENT_COLORFULNESS:
+        edge_ratio = compute_edge_ratio(img)
+        if not TEXT_EDGE_RATIO_RANGE[0] <= edge_ratio <= TEXT_EDGE_RATIO_RANGE[1]:
+            return True  # Edge density does not match printed text, keep image
+        if looks_like_page(img):
+            return False  # Page-shaped image with text-like edges, skip it
+
+    # Ambiguous case: use Tesseract to detect text in the image
+    # Convert image to RGB (pytesseract expects RGB)
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    custom_config = '--oem 3 --psm 6'  # LSTM OCR engine, assume a single uniform block of text
+    data = pytesseract.image_to_data(img_rgb, output_type=pytesseract.Output.DICT, config=custom_config)
+    num_words = len([word for word in data['text'] if word.strip() != ''])
+
+    # If significant text is detected, consider it as text content and skip the image
+    if num_words > 10:
+        return False  # Skip image containing text content
+    else:
+        return True  # Keep image
+
 def process_pdf(pdf_path):
     base_filename = os.path.splitext(os.path.basename(pdf_path))[0]
     unique_id = get_unique_id(base_filename)
@@ -211,26 +259,44 @@ def process_pdf(pdf_path):
     base_filename = clean_filename(base_filename, unique_id)
     text_output_path = os.path.join(TEXT_OUTPUT_DIR, f"{base_filename}.txt")
 
-    if extract_text_from_pdf(pdf_path, text_output_path):
-        logging.info(f"Text extraction completed for {pdf_path}")
-    else:
-        logging.warning(f"Text extraction failed for {pdf_path}")
+    # Open the PDF once and share the handle between text and image extraction
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        logging.error(f"Failed to open {pdf_path} with PyMuPDF: {e}")
+        doc = None
 
-    if extract_images_tables(pdf_path, base_filename, unique_id):
-        logging.info(f"Images and tables extraction completed for {pdf_path}")
-    else:
-        logging.warning(f"Images and tables extraction failed for {pdf_path}")
+    try:
+        if extract_text_from_pdf(doc, pdf_path, text_output_path):
+            logging.info(f"Text extraction completed for {pdf_path}")
+        else:
+            logging.warning(f"Text extraction failed for {pdf_path}")
+
+        if extract_images_tables(doc, pdf_path, base_filename, unique_id):
+            logging.info(f"Images and tables extraction completed for {pdf_path}")
+        else:
+            logging.warning(f"Images and tables extraction failed for {pdf_path}")
+    finally:
+        if doc is not None:
+            doc.close()
 
 def main():
-    pdf_files = [f for f in os.listdir(PDF_INPUT_DIR) if f.lower().endswith('.pdf')]
+    with os.scandir(PDF_INPUT_DIR) as entries:
+        pdf_entries = [entry for entry in entries if entry.name.lower().endswith('.pdf')]
 
-    if not pdf_files:
+    if not pdf_entries:
         logging.warning(f"No PDF files found in {PDF_INPUT_DIR}.")
         return
 
-    num_workers = min(cpu_count(), len(pdf_files))
+    # Largest files first so a big straggler does not start last and hold up the pool
+    pdf_entries.sort(key=lambda entry: entry.stat().st_size, reverse=True)
+    pdf_paths = [entry.path for entry in pdf_entries]
+
+    num_workers = min(cpu_count(), len(pdf_paths))
     with Pool(processes=num_workers) as pool:
-        pool.map(process_pdf, [os.path.join(PDF_INPUT_DIR, pdf_file) for pdf_file in pdf_files])
+        # One file per task so workers pick up new PDFs as soon as they are free
+        for _ in pool.imap_unordered(process_pdf, pdf_paths, chunksize=1):
+            pass
 
 if __name__ == "__main__":
     logging.info("Starting PDF processing workflow...")
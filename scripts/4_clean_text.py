@@ -1,11 +1,17 @@
 import os
 import re
+import json
+import hashlib
 import logging
+import numba
+import numpy as np
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 
 # Setup logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# numba logs its bytecode and IR dumps at DEBUG while compiling the scanners below
+logging.getLogger('numba').setLevel(logging.WARNING)
 
 # Paths for input and output
 input_dir = Path(r"C:\Users\Georg\Projects\Data_Processing\data\B_Extracted")
@@ -14,27 +20,102 @@ output_dir = Path(r"C:\Users\Georg\Projects\Data_Processing\data\C_Cleaned")
 # Ensure the output directory exists
 output_dir.mkdir(parents=True, exist_ok=True)
 
+# Records the (mtime_ns, size) of each input when it was last cleaned
+CACHE_FILENAME = '.clean_cache.json'
+
+# Hash of this script, stored in the cache header: when the cleaning code changes the whole cache
+# is dropped, so every file is cleaned again with the new code
+with open(__file__, 'rb') as f:
+    CODE_VERSION = hashlib.blake2b(f.read()).hexdigest()
+
+# Common OCR artifacts: 'NUL' markers and random strings of digits
+# ('\x00' bytes are dropped by the byte scanner below)
+ARTIFACT_PATTERN = re.compile(r'(?i:\bNUL\b)|\d{6,}')
+
+@numba.njit(cache=True)
+def space_width(src, i, length):
+    """
+    Byte length of the whitespace character starting at src[i], or 0 if it is not whitespace.
+    Same set as the regex '\s': ASCII \t \n \v \f \r, \x1c-\x1f and space, plus the UTF-8
+    encodings of U+0085, U+00A0 (NBSP), U+1680, U+2000-U+200A, U+2028, U+2029, U+202F, U+205F and U+3000.
+    """
+    byte = src[i]
+    if (9 <= byte <= 13) or (28 <= byte <= 32):
+        return 1
+    if byte == 0xC2 and i + 1 < length:
+        return 2 if src[i + 1] == 0x85 or src[i + 1] == 0xA0 else 0
+    if 0xE1 <= byte <= 0xE3 and i + 2 < length:
+        second = src[i + 1]
+        third = src[i + 2]
+        if byte == 0xE1:
+            return 3 if second == 0x9A and third == 0x80 else 0
+        if byte == 0xE2:
+            if second == 0x80 and (third <= 0x8A or third == 0xA8 or third == 0xA9 or third == 0xAF):
+                return 3  # third is a continuation byte, so <= 0x8A means U+2000-U+200A
+            return 3 if second == 0x81 and third == 0x9F else 0
+        return 3 if second == 0x80 and third == 0x80 else 0
+    return 0
+
+@numba.njit(cache=True)
+def collapse_spacing(src, dst):
+    """
+    Single pass over UTF-8 bytes: drop '\x00', collapse whitespace runs (newlines, tabs,
+    or two or more whitespace characters) to one space and runs of dots to one dot.
+    Writes into dst and returns the number of bytes written.
+    """
+    length = src.shape[0]
+    written = 0
+    i = 0
+    while i < length:
+        byte = src[i]
+        width = space_width(src, i, length) if byte != 0 else 0
+        if byte == 0:
+            i += 1
+        elif width:
+            start = i
+            run = 0
+            while i < length:
+                if src[i] == 0:
+                    i += 1
+                    continue
+                char_width = space_width(src, i, length)
+                if not char_width:
+                    break
+                run += 1
+                i += char_width
+            if run > 1 or byte == 9 or byte == 10:
+                dst[written] = 32
+                written += 1
+            else:
+                # A lone whitespace character other than a newline or tab is kept as-is
+                for k in range(width):
+                    dst[written + k] = src[start + k]
+                written += width
+        elif byte == 46:
+            while i < length and (src[i] == 0 or src[i] == 46):
+                i += 1
+            dst[written] = 46
+            written += 1
+        else:
+            dst[written] = byte
+            written += 1
+            i += 1
+    return written
+
 def clean_text(text):
     """
     Clean the input text by removing any common OCR errors and general cleaning.
     """
-    # Remove occurrences of 'NUL' (case-insensitive)
-    cleaned_text = re.sub(r'\bNUL\b', '', text, flags=re.IGNORECASE)
+    # Remove OCR artifacts first so the whitespace they leave behind is collapsed below
+    cleaned_text = ARTIFACT_PATTERN.sub('', text)
+
+    # Collapse whitespace, drop '\x00' and normalize multiple dots in one compiled byte scan
+    src = np.frombuffer(cleaned_text.encode('utf-8'), dtype=np.uint8)
+    dst = np.empty_like(src)
+    written = collapse_spacing(src, dst)
 
-    # Remove common OCR artifacts (e.g., '\x00', random strings of digits, etc.)
-    cleaned_text = re.sub(r'\x00|\d{6,}', '', cleaned_text)
-    
-    # Remove extra whitespace, newlines, and tabs
-    cleaned_text = re.sub(r'[\n\t]+', ' ', cleaned_text)
-    cleaned_text = re.sub(r'\s{2,}', ' ', cleaned_text)
-    
-    # Normalize multiple dots (e.g., replace ".." or more with ".")
-    cleaned_text = re.sub(r'\.{2,}', '.', cleaned_text)
-    
     # Strip leading/trailing whitespace
-    cleaned_text = cleaned_text.strip()
-    
-    return cleaned_text
+    return dst[:written].tobytes().decode('utf-8').strip()
 
 def process_file(file_path, output_dir):
     """
@@ -52,11 +133,34 @@ def process_file(file_path, output_dir):
             f.write(cleaned_data)
 
         logging.info(f"Processed and cleaned: {file_path.name}")
+        return True
     
     except FileNotFoundError as e:
         logging.error(f"File not found: {file_path} - {e}")
     except Exception as e:
         logging.error(f"Error processing {file_path.name}: {e}")
+    return False
+
+def load_cache(cache_path):
+    """
+    Load the clean cache, starting fresh if it is missing, unreadable or written by a different version of this script.
+    """
+    try:
+        with cache_path.open('r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != CODE_VERSION:
+        logging.info("Cleaning code changed since the cache was written; cleaning every file again.")
+        return {}
+    return cache.get('files', {})
+
+def save_cache(cache_path, cache):
+    """
+    Persist the clean cache next to the cleaned files, tagged with the current code version.
+    """
+    with cache_path.open('w', encoding='utf-8') as f:
+        json.dump({'version': CODE_VERSION, 'files': cache}, f)
 
 def process_files(input_dir, output_dir, max_workers=None):
     """
@@ -70,30 +174,54 @@ def process_files(input_dir, output_dir, max_workers=None):
         return
 
     # Find all text files (.txt)
-    files = list(input_dir.glob('*.txt'))
+    with os.scandir(input_dir) as entries:
+        input_entries = [entry for entry in entries if entry.name.lower().endswith('.txt') and entry.is_file()]
     
-    if not files:
+    if not input_entries:
         logging.warning(f"No files found in the input directory: {input_dir}")
         return
 
-    # Determine the number of threads (default: os.cpu_count() if not provided)
+    # Skip inputs whose mtime and size match the cache and whose output still exists
+    cache_path = output_dir / CACHE_FILENAME
+    cache = load_cache(cache_path)
+    with os.scandir(output_dir) as entries:
+        existing_outputs = {entry.name for entry in entries}
+
+    files = []
+    signatures = []
+    for entry in input_entries:
+        stat = entry.stat()
+        signature = [stat.st_mtime_ns, stat.st_size]
+        if entry.name in existing_outputs and cache.get(entry.name) == signature:
+            continue
+        files.append(Path(entry.path))
+        signatures.append(signature)
+
+    logging.info(f"Skipping {len(input_entries) - len(files)} unchanged files.")
+    if not files:
+        logging.info("All files are up to date.")
+        return
+
+    # Determine the number of worker processes (default: os.cpu_count() if not provided)
     if max_workers is None:
         max_workers = os.cpu_count()
 
-    # Using ThreadPoolExecutor for concurrent file processing
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(process_file, file, output_dir): file for file in files}
+    # Using ProcessPoolExecutor so the cleaning is not serialized on the GIL
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # process_file logs its own errors; only successful files are recorded in the cache
+        results = executor.map(process_file, files, [output_dir] * len(files), chunksize=4)
+        for file, signature, succeeded in zip(files, signatures, results):
+            if succeeded:
+                cache[file.name] = signature
 
-        for future in as_completed(futures):
-            file = futures[future]
-            try:
-                future.result()  # This will raise any exceptions that occurred during file processing
-            except Exception as exc:
-                logging.error(f"File {file.name} generated an exception: {exc}")
+    save_cache(cache_path, cache)
 
     logging.info("All files have been processed.")
 
-if __name__ == "__main__":
+def main():
     logging.info("Script is starting...")
     process_files(input_dir, output_dir, max_workers=None)  # Uses os.cpu_count() by default for max_workers
     logging.info("Script has completed.")
+
+if __name__ == "__main__":
+    main()
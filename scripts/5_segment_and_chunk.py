@@ -1,15 +1,20 @@
 import os
+import mmap
 import logging
 import tiktoken
 from multiprocessing import Pool, cpu_count, Lock
 import re
-import psutil
-import time
-import spacy
 
 # Lock for multiprocessing safety
 lock = Lock()
 
+# Sentence boundary: whitespace after terminal punctuation, followed by a likely sentence start
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(])')
+
+# Fenced code block; with DOTALL, '.' already spans newlines.
+# Matched on the raw UTF-8 bytes: '`' is ASCII, so fence boundaries never split a character
+CODE_FENCE = re.compile(rb'```.*?```', re.DOTALL)
+
 # Paths for input and output
 INPUT_DIR = r"C:\Users\Georg\Projects\Data_Processing\data\C_Cleaned"
 OUTPUT_DIR = r"C:\Users\Georg\Projects\Data_Processing\data\D_Chunked"
@@ -36,138 +41,128 @@ def setup_logging(log_file_name='segment_text.log'):
 
     return logger
 
-def throttle_if_needed(threshold=85, sleep_time=5):
-    cpu_usage = psutil.cpu_percent()
-    if cpu_usage > threshold:
-        logging.warning(f"High CPU usage detected: {cpu_usage}%. Throttling processing for {sleep_time} seconds.")
-        time.sleep(sleep_time)
-
-def preprocess_text(text):
+def preprocess_text(data):
+    # data is UTF-8 bytes (or a memory map of them); only the individual segments are decoded
     segments = []
-    code_pattern = re.compile(r'```[\s\S]*?```', re.DOTALL)
     last_idx = 0
 
-    for match in code_pattern.finditer(text):
+    for match in CODE_FENCE.finditer(data):
         if last_idx < match.start():
-            segments.append(('text', text[last_idx:match.start()]))
-        segments.append(('code', match.group()))
+            segments.append(('text', data[last_idx:match.start()].decode('utf-8')))
+        segments.append(('code', match.group().decode('utf-8')))
         last_idx = match.end()
 
-    if last_idx < len(text):
-        segments.append(('text', text[last_idx:]))
+    if last_idx < len(data):
+        segments.append(('text', data[last_idx:].decode('utf-8')))
 
     return segments
 
-def split_into_sentences(text, max_length=None):
-    if nlp is None:
-        logging.error("NLP model is not initialized.")
-        return []
-
-    sentences = []
-    current_start = 0
-    text_length = len(text)
-    max_length = max_length or 1000000
-
-    while current_start < text_length:
-        current_end = min(current_start + max_length, text_length)
-        sub_text = text[current_start:current_end]
-
-        if current_end < text_length:
-            last_space = sub_text.rfind(' ')
-            if last_space != -1:
-                current_end = current_start + last_space
-                sub_text = text[current_start:current_end]
-
-        doc = nlp(sub_text)
-        sub_sentences = [sent.text.strip() for sent in doc.sents]
-        sentences.extend(sub_sentences)
+def preprocess_file(input_path):
+    # Memory-map the file so it is never held as one decoded string next to its raw bytes
+    if os.path.getsize(input_path) == 0:
+        return []  # Empty files cannot be mapped
+    with open(input_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return preprocess_text(mm)
 
-        current_start = current_end
-
-    return sentences
-
-def chunk_segments(segments, max_tokens, overlap_tokens):
-    chunks = []
-    current_chunk = ""
-    current_tokens = 0
-    overlap_text = ""
+def split_into_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
 
+def split_into_pieces(segments):
+    # Flatten segments into the units a chunk is built from: whole code blocks and sentences,
+    # each carrying the separator that joins it to the previous piece
+    pieces = []
     for segment_type, segment in segments:
         if segment_type == 'code':
-            segment_tokens = len(tokenizer.encode(segment))
-            if current_tokens + segment_tokens > max_tokens:
-                if current_chunk:
-                    chunks.append({
-                        "text": current_chunk.strip(),
-                        "token_count": current_tokens
-                    })
-                    current_chunk = ""
-                    current_tokens = 0
-
-            current_chunk += "\n" + segment
-            current_tokens += segment_tokens
+            pieces.append(('code', "\n" + segment))
         else:
-            sentences = split_into_sentences(segment)
-            for sentence in sentences:
-                sentence_tokens = len(tokenizer.encode(sentence))
-                if current_tokens + sentence_tokens > max_tokens:
-                    if current_chunk:
-                        if overlap_tokens > 0:
-                            encoded_current = tokenizer.encode(current_chunk)
-                            overlap_tokens_actual = min(overlap_tokens, len(encoded_current))
-                            overlap_text = tokenizer.decode(encoded_current[-overlap_tokens_actual:])
-                        else:
-                            overlap_text = ""
-                        chunks.append({
-                            "text": current_chunk.strip(),
-                            "token_count": current_tokens
-                        })
-                        current_chunk = overlap_text
-                        current_tokens = len(tokenizer.encode(current_chunk))
-
-                current_chunk += " " + sentence
-                current_tokens += sentence_tokens
-
-    if current_chunk.strip():
-        chunks.append({
-            "text": current_chunk.strip(),
-            "token_count": current_tokens
-        })
+            pieces.extend(('text', " " + sentence) for sentence in split_into_sentences(segment))
+    return pieces
+
+def tail_ids(part_ids, count):
+    # Collect the last `count` token ids, walking back only over the parts that hold them
+    ids = []
+    for piece_ids in reversed(part_ids):
+        ids[:0] = piece_ids
+        if len(ids) >= count:
+            break
+    return ids[-count:]
+
+def chunk_segments(segments, max_tokens, overlap_tokens):
+    chunks = []
+    # The current chunk is kept as parallel lists of piece texts and their token ids;
+    # the text is joined once at flush and only the overlap is ever decoded
+    part_texts = []
+    part_ids = []
+    token_count = 0
+
+    # Tokenize every piece in one batched call; tiktoken runs BPE across threads without the GIL
+    pieces = split_into_pieces(segments)
+    encoded_pieces = tokenizer.encode_ordinary_batch([piece for _, piece in pieces], num_threads=min(8, cpu_count()))
+
+    for (piece_type, piece), piece_ids in zip(pieces, encoded_pieces):
+        if token_count and token_count + len(piece_ids) > max_tokens:
+            chunks.append({
+                "text": "".join(part_texts).strip(),
+                "token_count": token_count
+            })
+            # Sentences carry the chunk's trailing tokens over as overlap; code blocks start clean
+            if piece_type == 'text' and overlap_tokens > 0:
+                overlap_ids = tail_ids(part_ids, overlap_tokens)
+                part_texts = [tokenizer.decode(overlap_ids)]
+                part_ids = [overlap_ids]
+                token_count = len(overlap_ids)
+            else:
+                part_texts = []
+                part_ids = []
+                token_count = 0
+
+        part_texts.append(piece)
+        part_ids.append(piece_ids)
+        token_count += len(piece_ids)
+
+    if token_count:
+        text = "".join(part_texts).strip()
+        if text:
+            chunks.append({
+                "text": text,
+                "token_count": token_count
+            })
     
     return chunks
 
 def segment_text_file(input_path, output_dir):
     try:
-        throttle_if_needed()
-
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
             logging.info(f"Created directory {output_dir}")
 
-        with open(input_path, 'r', encoding='utf-8') as f:
-            text = f.read()
-
         logging.info(f"Starting segmentation for file: {input_path}")
 
         max_tokens = 3000  # Set the maximum tokens per chunk
         overlap_tokens = 200  # Set the overlap tokens for chunking
 
-        segments = preprocess_text(text)
+        segments = preprocess_file(input_path)
         chunks = chunk_segments(segments, max_tokens, overlap_tokens)
         logging.info(f"Total chunks created: {len(chunks)} for file {input_path}.")
 
         base_filename = os.path.splitext(os.path.basename(input_path))[0]
+        chunk_filenames = set()
         for i, chunk in enumerate(chunks):
             chunk_filename = f"{base_filename}_chunk_{i+1}.txt"
             chunk_path = os.path.join(output_dir, chunk_filename)
 
-            if os.path.exists(chunk_path):
-                logging.info(f"Chunk {chunk_filename} already exists. Skipping.")
-                continue
-
+            # Always rewrite: the script only reruns when its code or input changed, so an existing chunk may be stale
             with open(chunk_path, 'w', encoding='utf-8') as cf:
                 cf.write(chunk['text'])
+            chunk_filenames.add(chunk_filename)
             logging.info(f"Created chunk {chunk_filename} with {chunk['token_count']} tokens.")
+
+        # Remove chunks left over from an earlier run that split this file into more pieces
+        chunk_pattern = re.compile(re.escape(base_filename) + r'_chunk_\d+\.txt')
+        for chunk_filename in existing_chunks:
+            if chunk_filename not in chunk_filenames and chunk_pattern.fullmatch(chunk_filename):
+                os.remove(os.path.join(output_dir, chunk_filename))
+                logging.info(f"Removed stale chunk {chunk_filename}.")
         
         if chunks:
             #os.remove(input_path)
@@ -180,21 +175,23 @@ def segment_text_file(input_path, output_dir):
     except Exception as e:
         logging.error(f"Failed to segment text from {input_path}: {e}", exc_info=True)
 
-def worker_init():
-    global nlp, tokenizer
-    try:
-        nlp = spacy.load("en_core_web_sm", disable=["parser", "ner"])
-        if "sentencizer" not in nlp.pipe_names:
-            nlp.add_pipe("sentencizer")
-        tokenizer = tiktoken.get_encoding("cl100k_base")
-    except OSError:
-        logging.info("spaCy model not found. Downloading 'en_core_web_sm'...")
-        from spacy.cli import download
-        download("en_core_web_sm")
-        nlp = spacy.load("en_core_web_sm", disable=["parser", "ner"])
-        nlp.add_pipe("sentencizer")
-        tokenizer = tiktoken.get_encoding("cl100k_base")
-        logging.info("spaCy model 'en_core_web_sm' downloaded and loaded successfully.")
+def segment_task(task):
+    input_path, output_dir = task
+    segment_text_file(input_path, output_dir)
+
+def iter_tasks(input_dir, output_dir):
+    # Stream directory entries so workers start while the directory is still being listed
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith('.txt'):
+                yield (entry.path, output_dir)
+
+def worker_init(output_dir):
+    global tokenizer, existing_chunks
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    # List the output directory once per worker to find chunks from earlier runs;
+    # each input file produces its own chunk names, so workers never need each other's additions
+    existing_chunks = set(os.listdir(output_dir))
 
 def main():
     setup_logging()
@@ -203,18 +200,14 @@ def main():
         logging.error(f"Input directory not found: {INPUT_DIR}")
         return
 
-    txt_files = [f for f in os.listdir(INPUT_DIR) if f.lower().endswith('.txt')]
-    if not txt_files:
+    # Leave one core free for the rest of the system instead of sleeping workers when CPU is busy
+    with Pool(processes=max(1, cpu_count() - 1), initializer=worker_init, initargs=(OUTPUT_DIR,)) as pool:
+        processed = sum(1 for _ in pool.imap_unordered(segment_task, iter_tasks(INPUT_DIR, OUTPUT_DIR)))
+
+    if not processed:
         logging.warning(f"No TXT files found in {INPUT_DIR} for segmentation.")
         return
 
-    tasks = [(os.path.join(INPUT_DIR, txt_file), OUTPUT_DIR) for txt_file in txt_files]
-
-    num_workers = min(cpu_count(), len(tasks))
-
-    with Pool(processes=num_workers, initializer=worker_init) as pool:
-        pool.starmap(segment_text_file, tasks)
-
     logging.info("Text Segmentation Workflow Completed Successfully.")
 
 if __name__ == "__main__":
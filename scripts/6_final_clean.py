@@ -1,52 +1,54 @@
+import os
 import re
 import unicodedata
 import logging
+from multiprocessing import Pool, cpu_count
 from pathlib import Path
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Every spacing fix in one pattern, applied in a single sub pass:
+# 1. whitespace before punctuation (e.g. "word .", "word ,") -> removed
+# 2. punctuation directly followed by a word character -> one space inserted after it
+# 3. any whitespace run of two or more characters, or a single tab -> one space
+NORMALIZE_PATTERN = re.compile(r'(\s+)(?=[.,;!?])|([.,!?;:])(?=\w)|\s{2,}|\t')
+
+# Curly to straight quote mapping, applied in a single str.translate pass
+QUOTE_TABLE = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+
 def normalize_unicode(text):
     """
     Normalize unicode to NFC form to ensure consistent encoding.
     """
     return unicodedata.normalize('NFC', text)
 
-def fix_punctuation_spacing(text):
+def ensure_consistent_quotes(text):
     """
-    Ensures that punctuation (like periods, commas, colons) are consistently spaced.
-    - Removes spaces before punctuation (e.g., "word .", "word ,") and ensures
-      there's exactly one space after (unless it's the end of the string).
-    - Handles spacing for common punctuation marks.
+    Ensure that quotes are consistently used and fix common issues such as
+    mismatched straight and curly quotes.
     """
-    # Remove spaces before punctuation marks
-    text = re.sub(r'\s+([.,;!?])', r'\1', text)
-    
-    # Ensure single space after punctuation (excluding the end of the string)
-    text = re.sub(r'([.,!?;:])(\w)', r'\1 \2', text)  # Ensures a space after punctuation
-    
-    return text
+    # Normalize quotes (replace curly quotes with straight quotes)
+    return text.translate(QUOTE_TABLE)
 
-def remove_redundant_whitespace(text):
+def replace_spacing(match):
     """
-    Remove unnecessary whitespaces, tabs, and normalize newlines.
-    - Reduces multiple spaces to a single space.
-    - Normalizes newline characters (if present) but doesn't remove them.
+    Replacement for each NORMALIZE_PATTERN match, chosen by the branch that matched.
     """
-    text = re.sub(r'[ \t]+', ' ', text)  # Replace multiple spaces or tabs with a single space
-    text = re.sub(r'\s{2,}', ' ', text)  # Replace any long sequence of spaces with a single space
-    return text.strip()  # Strip leading and trailing whitespace
+    if match.lastindex == 1:
+        return ''  # Remove spaces before punctuation marks
+    if match.lastindex == 2:
+        return match.group(2) + ' '  # Ensure a space after punctuation
+    return ' '  # Replace runs of whitespace or tabs with a single space
 
-def ensure_consistent_quotes(text):
+def fix_spacing(text):
     """
-    Ensure that quotes are consistently used and fix common issues such as
-    mismatched straight and curly quotes.
+    Fix punctuation spacing and remove redundant whitespace in one pass.
+    - Removes spaces before punctuation and ensures there's a space after
+      punctuation that runs straight into a word.
+    - Reduces runs of whitespace and tabs to a single space, but keeps single newlines.
     """
-    # Normalize quotes (replace curly quotes with straight quotes)
-    text = text.replace("“", '"').replace("”", '"')
-    text = text.replace("‘", "'").replace("’", "'")
-    
-    return text
+    return NORMALIZE_PATTERN.sub(replace_spacing, text).strip()  # Strip leading and trailing whitespace
 
 def normalize_text(text):
     """
@@ -54,12 +56,42 @@ def normalize_text(text):
     without breaking existing content.
     """
     text = normalize_unicode(text)  # Ensure consistent unicode encoding
-    text = fix_punctuation_spacing(text)  # Handle punctuation spacing
-    text = remove_redundant_whitespace(text)  # Clean up redundant spaces and tabs
     text = ensure_consistent_quotes(text)  # Ensure consistent quote marks
+    text = fix_spacing(text)  # Handle punctuation spacing and redundant whitespace
     
     return text
 
+def clean_file(task):
+    """
+    Read one input file, normalize its text, and write it to its output path.
+    """
+    input_path, output_path = task
+    try:
+        # Read the input file
+        with input_path.open('r', encoding='utf-8') as f:
+            text = f.read()
+
+        # Normalize and enhance the text
+        cleaned_text = normalize_text(text)
+
+        # Write the cleaned text to the output file
+        with output_path.open('w', encoding='utf-8') as f:
+            f.write(cleaned_text)
+
+        logging.info(f"Processed and cleaned: {input_path.name}")
+
+    except Exception as e:
+        logging.error(f"Error processing {input_path.name}: {e}")
+
+def iter_tasks(input_dir, output_dir):
+    """
+    Yield (input_path, output_path) pairs while the input directory is being listed.
+    """
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.txt'):  # Modify if you need other formats
+                yield Path(entry.path), output_dir / entry.name
+
 def process_files(input_dir, output_dir):
     """
     Process each file in the input directory, clean the text, and save it to the output directory.
@@ -73,34 +105,20 @@ def process_files(input_dir, output_dir):
         logging.error(f"Input directory does not exist: {input_dir}")
         return
     
-    files = list(input_dir.glob('*.txt'))  # Modify if you need other formats
-    if not files:
-        logging.warning(f"No files found in the input directory: {input_dir}")
-        return
+    # Files are independent, so clean them across all cores as the directory listing streams in
+    with Pool(processes=cpu_count()) as pool:
+        processed = sum(1 for _ in pool.imap_unordered(clean_file, iter_tasks(input_dir, output_dir), chunksize=16))
 
-    for file_path in files:
-        try:
-            # Read the input file
-            with file_path.open('r', encoding='utf-8') as f:
-                text = f.read()
-
-            # Normalize and enhance the text
-            cleaned_text = normalize_text(text)
-
-            # Write the cleaned text to the output file
-            output_path = output_dir / file_path.name
-            with output_path.open('w', encoding='utf-8') as f:
-                f.write(cleaned_text)
-
-            logging.info(f"Processed and cleaned: {file_path.name}")
-
-        except Exception as e:
-            logging.error(f"Error processing {file_path.name}: {e}")
+    if not processed:
+        logging.warning(f"No files found in the input directory: {input_dir}")
 
-if __name__ == "__main__":
+def main():
     input_dir = r"C:\Users\Georg\Projects\Data_Processing\data\D_Chunked"
     output_dir = r"C:\Users\Georg\Projects\Data_Processing\data\E_Cleaned_Again"
 
     logging.info("Script is starting...")
     process_files(input_dir, output_dir)
     logging.info("Script has completed.")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import os
 import re
 import json
+import orjson
 import sqlite3
 import logging
+import ahocorasick
+from multiprocessing import Pool, cpu_count
 from pathlib import Path
 from collections import Counter
 from math import log10
@@ -27,9 +30,64 @@ def load_metadata_keywords():
 
 metadata_keywords = load_metadata_keywords()
 
-# Clean text function to simplify matching and remove unnecessary spaces or special characters
+WORD_PATTERN = re.compile(r'\S+')
+
+# Metadata field -> keyword section in metadata_keywords.json
+KEYWORD_SECTIONS = {
+    'category': 'CATEGORY_KEYWORDS',
+    'tags': 'TAG_KEYWORDS',
+    'research_type': 'RESEARCH_TYPE_KEYWORDS',
+    'sentiment_type': 'SENTIMENT_TYPE',
+}
+
+# Build a single Aho-Corasick automaton over every keyword in every section
+def build_keyword_automaton(metadata_keywords):
+    owners = {}
+    for field, section in KEYWORD_SECTIONS.items():
+        for label, keywords in metadata_keywords[section].items():
+            for keyword in keywords:
+                owners.setdefault(keyword.lower(), []).append((field, label))
+
+    automaton = ahocorasick.Automaton()
+    for keyword, keyword_owners in owners.items():
+        automaton.add_word(keyword, (keyword, keyword_owners))
+    automaton.make_automaton()
+    return automaton
+
+keyword_automaton = build_keyword_automaton(metadata_keywords)
+
+# Count, per field and label, how many of its keywords occur in the text, and how often tag keywords
+# occur in total, using one pass over the text
+def count_keyword_hits(cleaned_text):
+    occurrences = Counter()
+    owners = {}
+    last_end = {}
+    for end, (keyword, keyword_owners) in keyword_automaton.iter(cleaned_text):
+        owners[keyword] = keyword_owners
+        # Only count non-overlapping occurrences, as str.count does ("nnn" holds one "nn", not two)
+        if end - len(keyword) < last_end.get(keyword, -1):
+            continue
+        occurrences[keyword] += 1
+        last_end[keyword] = end
+
+    raw_counts = {field: Counter() for field in KEYWORD_SECTIONS}
+    tag_matches = 0
+    for keyword, keyword_owners in owners.items():
+        for field, label in keyword_owners:
+            raw_counts[field][label] += 1
+            if field == 'tags':
+                tag_matches += occurrences[keyword]
+
+    # Rebuild each Counter in keyword-file order so most_common breaks ties as before
+    keyword_hits = {
+        field: Counter({label: raw_counts[field][label] for label in metadata_keywords[section] if raw_counts[field][label]})
+        for field, section in KEYWORD_SECTIONS.items()
+    }
+    return keyword_hits, tag_matches
+
+# Clean text function to simplify matching; keywords are matched against the lowercased text
 def clean_text(text):
-    return re.sub(r'[^\w\s]', '', text).lower().strip()
+    return text.lower().strip()
 
 # Function to ensure the year is a valid four-digit year
 def clean_year(year):
@@ -41,9 +99,10 @@ def clean_tags(tags):
 
 # Function to skip initial blank/irrelevant pages (skip first 500 words)
 def skip_initial_text(text, word_skip_count=500):
-    words = text.split()
-    if len(words) > word_skip_count:
-        return ' '.join(words[word_skip_count:])
+    # Find where the first word after the skipped ones starts and slice there, without splitting the text
+    for index, match in enumerate(WORD_PATTERN.finditer(text)):
+        if index == word_skip_count:
+            return text[match.start():]
     return text  # If the file is short, return the full content
 
 # Function to extract the **correct** unique ID (6 digits in brackets) from the filename
@@ -70,21 +129,13 @@ def extract_title(file_content):
     return "Untitled"  # Default if no valid title is found
 
 # Calculate relevance based on the density of TAG_KEYWORDS in the remaining text using a logarithmic scale (1-100)
-def calculate_relevance(cleaned_text):
-    tag_counts = Counter()
+# total_matches is the number of tag keyword occurrences counted by count_keyword_hits
+def calculate_relevance(cleaned_text, total_matches):
     total_words = len(cleaned_text.split())
 
     if total_words < 100:
         return 1
 
-    # Calculate tag keyword matches
-    for tag, keywords in metadata_keywords['TAG_KEYWORDS'].items():
-        for keyword in keywords:
-            matches = cleaned_text.count(keyword.lower())  # Frequency of the keyword
-            tag_counts[tag] += matches
-
-    total_matches = sum(tag_counts.values())
-
     # Calculate keyword density (matches per 1000 words)
     keyword_density = (total_matches / total_words) * 1000
 
@@ -118,127 +169,142 @@ def extract_metadata(file_content, filename):
     year_match = re.search(r'\b(19|20)\d{2}\b', file_content)
     metadata['year'] = clean_year(year_match.group(0) if year_match else "Unknown")
 
-    # Extract categories, tags, research_type, and sentiment_type
-    metadata['category'] = extract_category(cleaned_content)
-    metadata['tags'] = clean_tags(extract_tags(cleaned_content))
-    metadata['research_type'] = extract_research_type(cleaned_content)
-    metadata['sentiment_type'] = extract_sentiment_type(cleaned_content)
+    # Extract categories, tags, research_type, and sentiment_type from a single keyword scan
+    keyword_hits, tag_matches = count_keyword_hits(cleaned_content)
+    metadata['category'] = extract_category(keyword_hits['category'])
+    metadata['tags'] = clean_tags(extract_tags(keyword_hits['tags']))
+    metadata['research_type'] = extract_research_type(keyword_hits['research_type'])
+    metadata['sentiment_type'] = extract_sentiment_type(keyword_hits['sentiment_type'])
 
     # Calculate relevance based on tag keyword densities (1-100 with logarithmic scaling)
-    metadata['relevance'] = calculate_relevance(cleaned_content)
+    metadata['relevance'] = calculate_relevance(cleaned_content, tag_matches)
 
     return metadata
 
-# Helper functions to extract category, tags, research type, and sentiment
-def extract_category(cleaned_text):
-    category_counts = Counter()
-    for category, keywords in metadata_keywords['CATEGORY_KEYWORDS'].items():
-        for keyword in keywords:
-            if keyword.lower() in cleaned_text:
-                category_counts[category] += 1
+# Helper functions to pick category, tags, research type, and sentiment from the keyword hit counts
+def extract_category(category_counts):
     return category_counts.most_common(1)[0][0] if category_counts else "Uncategorized"
 
-def extract_tags(cleaned_text):
-    tag_counts = Counter()
-    for tag, keywords in metadata_keywords['TAG_KEYWORDS'].items():
-        for keyword in keywords:
-            if keyword.lower() in cleaned_text:
-                tag_counts[tag] += 1
+def extract_tags(tag_counts):
     return [tag for tag, _ in tag_counts.most_common(5)]
 
-def extract_research_type(cleaned_text):
-    research_type_counts = Counter()
-    for research_type, keywords in metadata_keywords['RESEARCH_TYPE_KEYWORDS'].items():
-        for keyword in keywords:
-            if keyword.lower() in cleaned_text:
-                research_type_counts[research_type] += 1
+def extract_research_type(research_type_counts):
     return research_type_counts.most_common(1)[0][0] if research_type_counts else "Unclassified"
 
-def extract_sentiment_type(cleaned_text):
-    sentiment_counts = Counter()
-    for sentiment_type, keywords in metadata_keywords['SENTIMENT_TYPE'].items():
-        for keyword in keywords:
-            if keyword.lower() in cleaned_text:
-                sentiment_counts[sentiment_type] += 1
+def extract_sentiment_type(sentiment_counts):
     return sentiment_counts.most_common(1)[0][0] if sentiment_counts else "General Analysis"
 
 # Function to save metadata to a JSON file
-def save_metadata_to_json(metadata_json, output_metadata_dir):
-    # Remove 'relevance' before saving to JSON as it's internal to the DB
-    metadata_for_json = metadata_json.copy()
-    metadata_for_json.pop('relevance', None)
+def save_metadata_to_json(metadata, output_metadata_dir):
+    # Leave out 'relevance' when saving to JSON as it's internal to the DB
+    metadata_for_json = {key: value for key, value in metadata.items() if key != 'relevance'}
 
     # Use unique_id as part of the JSON file name to maintain consistency
     output_file = output_metadata_dir / f"{metadata_for_json['unique_id']}.json"
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(metadata_for_json, f, ensure_ascii=False, indent=4)
+    # orjson writes UTF-8 bytes directly (non-ASCII is kept as-is); it only supports 2-space indentation
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(metadata_for_json, option=orjson.OPT_INDENT_2))
 
     logging.info(f"Saved metadata to JSON for {metadata_for_json['unique_id']}")
 
-# Function to save metadata to SQLite database
-def save_metadata_to_db(metadata_db, db_path):
+# Function to convert metadata into a row of the metadata table
+def metadata_to_row(metadata):
+    return (
+        metadata['unique_id'],
+        metadata['title'],
+        metadata['year'],
+        metadata['category'],
+        ','.join(metadata['tags']),
+        metadata['research_type'],
+        metadata['sentiment_type'],
+        metadata['relevance']
+    )
+
+# Function to save a batch of metadata rows to SQLite database in a single transaction
+def save_metadata_to_db(rows, db_path):
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Create table if not exists
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS metadata (
-        unique_id TEXT PRIMARY KEY,
-        title TEXT,
-        year TEXT,
-        category TEXT,
-        tags TEXT,
-        research_type TEXT,
-        sentiment_type TEXT,
-        relevance INTEGER
-    )''')
-
-    cursor.execute('''
-    INSERT OR REPLACE INTO metadata (unique_id, title, year, category, tags, research_type, sentiment_type, relevance)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (
-        metadata_db['unique_id'],
-        metadata_db['title'],
-        metadata_db['year'],
-        metadata_db['category'],
-        ','.join(metadata_db['tags']),
-        metadata_db['research_type'],
-        metadata_db['sentiment_type'],
-        metadata_db['relevance']
-    ))
-
-    conn.commit()
-    conn.close()
-    logging.info(f"Saved metadata to DB for {metadata_db['unique_id']}")
+    try:
+        # WAL with synchronous=NORMAL avoids a full fsync on every commit
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        cursor = conn.cursor()
+
+        # Create table if not exists
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metadata (
+            unique_id TEXT PRIMARY KEY,
+            title TEXT,
+            year TEXT,
+            category TEXT,
+            tags TEXT,
+            research_type TEXT,
+            sentiment_type TEXT,
+            relevance INTEGER
+        )''')
+
+        cursor.executemany('''
+        INSERT OR REPLACE INTO metadata (unique_id, title, year, category, tags, research_type, sentiment_type, relevance)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+        conn.commit()
+    finally:
+        conn.close()
+    logging.info(f"Saved metadata to DB for {len(rows)} files")
+
+# Read one file and extract its metadata; runs in a worker process
+def analyze_file(file):
+    try:
+        with file.open('r', encoding='utf-8') as f:
+            content = f.read()
+        return extract_metadata(content, file.name)
+    except Exception as e:
+        logging.error(f"Error processing file {file.name}: {e}")
+        return None
+
+# Yield the TXT files in the input directory while it is being listed
+def iter_files(input_dir):
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('.txt'):
+                yield Path(entry.path)
 
 # Process each file in the input directory
 def process_files(input_dir, output_metadata_dir, db_path):
     logging.info("Starting to process files for metadata extraction...")
 
-    files = list(input_dir.glob('*.txt'))
+    if not input_dir.exists():
+        logging.error(f"Input directory does not exist: {input_dir}")
+        return
 
-    if not files:
+    # Keyword matching runs in parallel; each worker builds the keyword automaton once at import.
+    # Only this process writes, and DB rows are committed in one transaction at the end.
+    db_rows = []
+    processed = 0
+    with Pool(processes=cpu_count()) as pool:
+        for metadata in pool.imap_unordered(analyze_file, iter_files(input_dir), chunksize=8):
+            processed += 1
+            if not metadata:
+                continue
+            try:
+                # Neither writer modifies the metadata, so both read the same dict
+                save_metadata_to_json(metadata, output_metadata_dir)
+                db_rows.append(metadata_to_row(metadata))
+
+            except Exception as e:
+                logging.error(f"Error saving metadata for {metadata['unique_id']}: {e}")
+
+    if not processed:
         logging.warning(f"No TXT files found in {input_dir}.")
         return
 
-    for file in files:
-        try:
-            with file.open('r', encoding='utf-8') as f:
-                content = f.read()
-
-            metadata = extract_metadata(content, file.name)
-            if metadata:
-                # Create separate copies for JSON and DB to prevent unintended modifications
-                metadata_json = metadata.copy()
-                metadata_db = metadata.copy()
+    if db_rows:
+        save_metadata_to_db(db_rows, db_path)
 
-                save_metadata_to_json(metadata_json, output_metadata_dir)
-                save_metadata_to_db(metadata_db, db_path)
-
-        except Exception as e:
-            logging.error(f"Error processing file {file.name}: {e}")
-
-if __name__ == "__main__":
+def main():
     logging.info("Script is starting...")
     process_files(input_dir, output_metadata_dir, db_path)
     logging.info("Script has completed.")
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,9 @@
 
 import os
 import logging
-import json
+import orjson
 import tiktoken
-from multiprocessing import Pool, cpu_count
+from multiprocessing import Pool, Process, Queue, cpu_count
 import re
 
 def setup_logging(log_path, log_file_name):
@@ -37,37 +37,43 @@ def setup_logging(log_path, log_file_name):
     
     return logger
 
-def get_metadata(metadata_json_dir, unique_id):
+def load_metadata(metadata_json_dir):
     """
-    Retrieves metadata from JSON files based on unique_id.
+    Loads every metadata JSON file once, keyed by unique_id (the file stem).
     """
-    metadata_file_path = os.path.join(metadata_json_dir, f"{unique_id}.json")
+    metadata_by_id = {}
     try:
-        with open(metadata_file_path, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
-        return metadata
+        with os.scandir(metadata_json_dir) as entries:
+            for entry in entries:
+                unique_id, ext = os.path.splitext(entry.name)
+                if ext.lower() != '.json':
+                    continue
+                try:
+                    with open(entry.path, 'rb') as f:
+                        metadata_by_id[unique_id] = orjson.loads(f.read())
+                except Exception as e:
+                    logging.error(f"Failed to retrieve metadata for unique_id {unique_id}: {e}", exc_info=True)
     except FileNotFoundError:
-        logging.warning(f"No metadata JSON file found for unique_id: {unique_id}")
-        return {
-            "unique_id": unique_id,
-            "title": "",
-            "year": "",
-            "category": "",
-            "tags": [],
-            "research_type": "",
-            "sentiment_type": ""
-        }
-    except Exception as e:
-        logging.error(f"Failed to retrieve metadata for unique_id {unique_id}: {e}", exc_info=True)
-        return {
-            "unique_id": unique_id,
-            "title": "",
-            "year": "",
-            "category": "",
-            "tags": [],
-            "research_type": "",
-            "sentiment_type": ""
-        }
+        logging.error(f"Metadata JSON directory {metadata_json_dir} does not exist.")
+    return metadata_by_id
+
+def get_metadata(unique_id):
+    """
+    Retrieves metadata for unique_id from the metadata loaded in init_worker.
+    """
+    metadata = metadata_cache.get(unique_id)
+    if metadata is not None:
+        return metadata
+    logging.warning(f"No metadata JSON file found for unique_id: {unique_id}")
+    return {
+        "unique_id": unique_id,
+        "title": "",
+        "year": "",
+        "category": "",
+        "tags": [],
+        "research_type": "",
+        "sentiment_type": ""
+    }
 
 def extract_unique_id_from_filename(filename):
     """
@@ -89,22 +95,60 @@ def extract_unique_id_from_filename(filename):
     return 'unknown'
 
 
-def convert_chunk_to_json(args):
+# Chunks read and token-counted together in one encode_ordinary_batch call
+ENCODE_BATCH_SIZE = 256
+
+# Serialized JSON files waiting for the writer process; bounded so workers cannot run far ahead of the disk
+WRITE_QUEUE_SIZE = 1024
+
+# Tokenizer, metadata and write queue owned by each worker process, set once by init_worker
+tokenizer = None
+metadata_cache = {}
+write_queue = None
+
+def init_worker(metadata_by_id, queue):
     """
-    Converts a single text chunk into a JSON file with associated metadata.
+    Pool initializer: builds the tokenizer once per worker instead of pickling it with every task,
+    and keeps the metadata loaded by main so each document's JSON is parsed only once.
     """
-    chunk_path, output_json_dir, metadata_json_dir, tokenizer = args
-    try:
-        with open(chunk_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+    global tokenizer, metadata_cache, write_queue
+    tokenizer = tiktoken.get_encoding("cl100k_base")  # Correct encoding for GPT-4
+    metadata_cache = metadata_by_id
+    write_queue = queue
+
+def writer_loop(queue):
+    """
+    Writer process: writes each serialized JSON file and removes its source chunk, until it receives None.
+    """
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        
+        chunk_path, json_path, payload = item
+        try:
+            with open(json_path, 'wb') as jf:
+                jf.write(payload)
+            
+            logging.info(f"Converted {chunk_path} to {os.path.basename(json_path)}")
+            
+            # Remove the text chunk after successful JSON conversion
+            os.remove(chunk_path)
+            logging.info(f"Removed chunk file {chunk_path} after JSON conversion")
         
+        except Exception as e:
+            logging.error(f"Failed to convert {chunk_path} to JSON: {e}", exc_info=True)
+
+def convert_chunk_to_json(chunk_path, text, token_count, output_json_dir):
+    """
+    Converts a single text chunk into JSON with associated metadata and hands it to the writer process.
+    """
+    try:
         # Extract unique_id from the filename
         filename = os.path.basename(chunk_path)
         unique_id = extract_unique_id_from_filename(filename)
         
-        metadata = get_metadata(metadata_json_dir, unique_id)
-        
-        token_count = len(tokenizer.encode(text))
+        metadata = get_metadata(unique_id)
         
         # Prepare JSON data
         json_data = {
@@ -121,20 +165,57 @@ def convert_chunk_to_json(args):
         json_filename = f"{base_filename}.json"
         json_path = os.path.join(output_json_dir, json_filename)
         
-        # Write JSON data
-        with open(json_path, 'w', encoding='utf-8') as jf:
-            json.dump(json_data, jf, ensure_ascii=False, indent=4)
-        
-        logging.info(f"Converted {chunk_path} to {json_filename}")
+        # orjson serializes straight to UTF-8 bytes; indentation is 2 spaces (the only width it supports)
+        payload = orjson.dumps(json_data, option=orjson.OPT_INDENT_2)
         
-        # Remove the text chunk after successful JSON conversion
-        os.remove(chunk_path)
-        logging.info(f"Removed chunk file {chunk_path} after JSON conversion")
+        # The writer process does the file create and chunk delete so this worker can keep tokenizing
+        write_queue.put((chunk_path, json_path, payload))
     
     except Exception as e:
         logging.error(f"Failed to convert {chunk_path} to JSON: {e}", exc_info=True)
         # Do not raise exception to prevent stopping the entire pool
 
+def convert_chunk_batch(args):
+    """
+    Reads a batch of text chunks, counts their tokens in a single batched encode and converts each to JSON.
+    """
+    chunk_paths, output_json_dir = args
+    
+    paths = []
+    texts = []
+    for chunk_path in chunk_paths:
+        try:
+            with open(chunk_path, 'r', encoding='utf-8') as f:
+                texts.append(f.read())
+            paths.append(chunk_path)
+        except Exception as e:
+            logging.error(f"Failed to convert {chunk_path} to JSON: {e}", exc_info=True)
+    
+    try:
+        # One call into tiktoken's Rust core, which encodes the texts on its own threads without the GIL
+        token_counts = [len(tokens) for tokens in tokenizer.encode_ordinary_batch(texts, num_threads=4)]
+    except Exception as e:
+        logging.error(f"Failed to count tokens for a batch of {len(paths)} chunks: {e}", exc_info=True)
+        return
+    
+    for chunk_path, text, token_count in zip(paths, texts, token_counts):
+        convert_chunk_to_json(chunk_path, text, token_count, output_json_dir)
+
+def iter_chunk_batches(input_text_chunks_dir, output_json_dir):
+    """
+    Yields batches of chunk paths while the input directory is still being listed.
+    """
+    batch = []
+    with os.scandir(input_text_chunks_dir) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith('.txt'):
+                batch.append(entry.path)
+                if len(batch) == ENCODE_BATCH_SIZE:
+                    yield (batch, output_json_dir)
+                    batch = []
+    if batch:
+        yield (batch, output_json_dir)
+
 def main():
     # Paths (updated as per your request)
     input_text_chunks_dir = r"C:\Users\Georg\Desktop\Second_Batch\data\6_pre_json_cleaned"
@@ -151,36 +232,45 @@ def main():
     setup_logging(log_path, log_file_name)
     logging.info("JSON Conversion Workflow Started.")
     
-    # Initialize tokenizer with correct encoding
+    # Make sure the encoding loads before starting workers; each worker builds its own in init_worker
     try:
-        tokenizer = tiktoken.get_encoding("cl100k_base")  # Correct encoding for GPT-4
+        tiktoken.get_encoding("cl100k_base")  # Correct encoding for GPT-4
     except Exception as e:
         logging.error(f"Failed to initialize tokenizer: {e}", exc_info=True)
         return
     
-    # Prepare list of chunk TXT files from input_text_chunks_dir
-    try:
-        chunk_files = [f for f in os.listdir(input_text_chunks_dir) if f.lower().endswith('.txt')]
-    except FileNotFoundError:
+    if not os.path.isdir(input_text_chunks_dir):
         logging.error(f"Input text chunks directory {input_text_chunks_dir} does not exist.")
         return
     
-    if not chunk_files:
-        logging.warning(f"No text chunks found in {input_text_chunks_dir}.")
-        return
-    
-    tasks = []
-    for filename in chunk_files:
-        chunk_path = os.path.join(input_text_chunks_dir, filename)
-        tasks.append((chunk_path, output_json_dir, metadata_json_dir, tokenizer))
+    # Read each document's metadata once; chunks of the same document share it
+    metadata_by_id = load_metadata(metadata_json_dir)
     
     # Determine number of workers based on CPU cores and default batch size
     batch_size = 4  # Adjust as needed
     num_workers = min(cpu_count(), batch_size)
     
-    # Utilize multiprocessing Pool
-    with Pool(processes=num_workers) as pool:
-        pool.map(convert_chunk_to_json, tasks)
+    # A single writer process takes all file writes and removals off the workers
+    queue = Queue(maxsize=WRITE_QUEUE_SIZE)
+    writer = Process(target=writer_loop, args=(queue,))
+    writer.start()
+    
+    try:
+        # Utilize multiprocessing Pool
+        # Chunk batches are fed to the pool as the directory listing streams in
+        with Pool(processes=num_workers, initializer=init_worker, initargs=(metadata_by_id, queue)) as pool:
+            processed = sum(1 for _ in pool.imap_unordered(convert_chunk_batch, iter_chunk_batches(input_text_chunks_dir, output_json_dir)))
+            # Let workers exit normally so their queue feeder threads flush before the pool is torn down
+            pool.close()
+            pool.join()
+    finally:
+        # Every worker has finished putting its files, so the sentinel is the last item the writer sees
+        queue.put(None)
+        writer.join()
+    
+    if not processed:
+        logging.warning(f"No text chunks found in {input_text_chunks_dir}.")
+        return
     
     logging.info("JSON Conversion Workflow Completed Successfully.")
 
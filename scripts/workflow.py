@@ -2,8 +2,24 @@
 # <<Backup A_Collected folder before running scriptt>> 
 
 import os
+import sys
+import json
+import mmap
+import hashlib
+import logging
+import argparse
+import importlib
 import subprocess
 import time
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Workflow messages go through a queue to one listener thread in the main process, from every worker.
+# It does not propagate to the root logger, which the scripts configure for their own output
+logger = logging.getLogger("workflow")
+logger.setLevel(logging.INFO)
+logger.propagate = False
 
 # Define the path to the folder containing the scripts
 scripts_folder = r"C:\Users\Georg\Projects\Data_Processing\scripts"
@@ -20,9 +36,234 @@ scripts = [
     "8_chunk_to_Json.py"
 ]
 
+# Heavy libraries shared by several scripts, imported once when a pipeline worker starts
+preimport_modules = ["numpy", "cv2", "fitz", "numba", "tiktoken"]
+
+# Scripts each script depends on; a script starts as soon as all of them have finished.
+# Each script hands its results to the next on disk, one file per document (PDFs renamed in place,
+# text files, chunk files, metadata JSON). That keeps every script runnable on its own and lets the
+# stamps below skip scripts whose files have not changed
+stage_dependencies = {
+    "1_duplicate_removal_fix_names.py": [],
+    "2_clean_names_assign_id.py": ["1_duplicate_removal_fix_names.py"],
+    "3_extract_text.py": ["2_clean_names_assign_id.py"],
+    "4_clean_text.py": ["3_extract_text.py"],
+    "5_segment_and_chunk.py": ["4_clean_text.py"],
+    "6_final_clean.py": ["5_segment_and_chunk.py"],
+    "7_metadata_assignment.py": ["6_final_clean.py"],
+    "8_chunk_to_Json.py": ["6_final_clean.py", "7_metadata_assignment.py"],
+}
+
+# Folders and files each script reads and writes; a script is skipped when none of them,
+# nor the script itself, changed since its last successful run
+data_folder = r"C:\Users\Georg\Projects\Data_Processing\data"
+second_batch_folder = r"C:\Users\Georg\Desktop\Second_Batch\data"
+stage_paths = {
+    "1_duplicate_removal_fix_names.py": (
+        [os.path.join(data_folder, "A_Collected")],
+        [os.path.join(data_folder, "A_Collected")]),
+    "2_clean_names_assign_id.py": (
+        [os.path.join(data_folder, "A_Collected")],
+        [os.path.join(data_folder, "A_Collected"), r"C:\Users\Georg\Projects\Data_Processing\logs\unique_id_logs.txt"]),
+    "3_extract_text.py": (
+        [os.path.join(data_folder, "A_Collected")],
+        [os.path.join(data_folder, "B_Extracted")]),
+    "4_clean_text.py": (
+        [os.path.join(data_folder, "B_Extracted")],
+        [os.path.join(data_folder, "C_Cleaned")]),
+    "5_segment_and_chunk.py": (
+        [os.path.join(data_folder, "C_Cleaned")],
+        [os.path.join(data_folder, "D_Chunked")]),
+    "6_final_clean.py": (
+        [os.path.join(data_folder, "D_Chunked")],
+        [os.path.join(data_folder, "E_Cleaned_Again")]),
+    "7_metadata_assignment.py": (
+        [os.path.join(data_folder, "E_Cleaned_Again"), os.path.join(data_folder, "metadata_keywords.json")],
+        [os.path.join(data_folder, "F_Metadata"), r"C:\Users\Georg\Desktop\Cognitive_Research\database\metadata.db"]),
+    "8_chunk_to_Json.py": (
+        [os.path.join(second_batch_folder, "6_pre_json_cleaned"), os.path.join(second_batch_folder, "5_metadata_db")],
+        [os.path.join(second_batch_folder, "final_json")]),
+}
+
+# One stamp per script, holding the hashes recorded after its last successful run
+stamps_folder = os.path.join(scripts_folder, ".stamps")
+
+# Scripts whose stamps are refreshed after a script runs, because it rewrites their outputs in place.
+# Script 2 renames every PDF script 1 left in A_Collected, so script 1 is stamped against the folder's
+# final state; stamped after its own run it would always look stale, and rerunning it strips the IDs
+# script 2 then reassigns
+restamp_after = {
+    "2_clean_names_assign_id.py": ["1_duplicate_removal_fix_names.py"],
+}
+
+# Bytes fed to the hasher per update when hashing a memory-mapped file
+hash_chunk_size = 1 << 20
+
+# Files hashed at once; blake2b releases the GIL on large updates, so page-ins and hashing overlap
+hash_threads = 32
+
+# Digests of hashed files, kept with the (mtime_ns, size) they were taken at: a file whose modification
+# time and size are unchanged is not read again, the same check script 4's .clean_cache.json uses.
+# Saved next to the stamps, so a folder hashed for several stages, or by the next run's up-to-date check,
+# costs one stat per file. Loaded on first use in each process
+hash_cache_path = os.path.join(stamps_folder, "file_hashes.json")
+hash_cache = None
+
+def hash_file(file_path):
+    """
+    Returns the blake2b hex digest of a file's contents, hashed from a memory map in 1 MiB slices.
+    """
+    hasher = hashlib.blake2b()
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hasher.hexdigest()  # Empty files cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            # The file is read front to back once; let the OS read ahead aggressively where supported
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            for offset in range(0, len(view), hash_chunk_size):
+                hasher.update(view[offset:offset + hash_chunk_size])
+    return hasher.hexdigest()
+
+def iter_files(folder):
+    """
+    Yields the path and stat result of every file below a folder, walking it with os.scandir.
+    """
+    pending = [folder]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    yield entry.path, entry.stat()
+
+def load_hash_cache():
+    """
+    Returns this process's file hash cache, loading it from disk on first use.
+    """
+    global hash_cache
+    if hash_cache is None:
+        try:
+            with open(hash_cache_path, 'r', encoding='utf-8') as f:
+                hash_cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            hash_cache = {}
+    return hash_cache
+
+def save_hash_cache():
+    """
+    Writes the file hash cache through a temporary file, like the stamps.
+    """
+    if hash_cache is None:
+        return
+    os.makedirs(stamps_folder, exist_ok=True)
+    temp_path = hash_cache_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(hash_cache, f)
+    os.replace(temp_path, hash_cache_path)
+
+def hash_files(file_stats):
+    """
+    Hashes files using a pool of threads, reading only those whose modification time or size
+    changed since they were last hashed.
+    
+    Args:
+        file_stats (iterable): (file path, os.stat_result) pairs.
+    
+    Returns:
+        dict: File path -> blake2b hex digest.
+    """
+    cache = load_hash_cache()
+    file_stats = list(file_stats)
+    changed = [(file_path, stat) for file_path, stat in file_stats
+               if cache.get(file_path, [None, None])[:2] != [stat.st_mtime_ns, stat.st_size]]
+    
+    if changed:
+        with ThreadPoolExecutor(max_workers=hash_threads) as pool:
+            digests = pool.map(hash_file, [file_path for file_path, _ in changed])
+            # Keyed by the stat taken before reading, so a file modified while it was hashed is read again next time
+            for (file_path, stat), digest in zip(changed, digests):
+                cache[file_path] = [stat.st_mtime_ns, stat.st_size, digest]
+    return {file_path: cache[file_path][2] for file_path, _ in file_stats}
+
+def hash_path(path):
+    """
+    Hashes a file, or every file below a folder.
+    
+    Args:
+        path (str): The file or folder to hash.
+    
+    Returns:
+        dict: File path -> blake2b hex digest. Empty if the path does not exist.
+    """
+    if os.path.isfile(path):
+        return hash_files([(path, os.stat(path))])
+    digests = hash_files(iter_files(path)) if os.path.isdir(path) else {}
+    
+    # Forget files that are gone from the folder, so PDFs renamed by scripts 1 and 2 do not pile up
+    cache = load_hash_cache()
+    prefix = os.path.join(path, "")
+    for cached_path in [cached_path for cached_path in cache
+                        if cached_path.startswith(prefix) and cached_path not in digests]:
+        del cache[cached_path]
+    return digests
+
+def stage_state(script):
+    """
+    Hashes a script together with its known input and output paths.
+    """
+    inputs, outputs = stage_paths[script]
+    # A folder that is both input and output (scripts 1 and 2) is only hashed once
+    hashes = {path: hash_path(path) for path in dict.fromkeys(inputs + outputs)}
+    state = {"script_sha": hash_file(os.path.join(scripts_folder, script)), "inputs": {}, "outputs": {}}
+    for path in inputs:
+        state["inputs"].update(hashes[path])
+    for path in outputs:
+        state["outputs"].update(hashes[path])
+    return state
+
+def stamp_path(script):
+    """
+    Returns the path of a script's stamp file.
+    """
+    return os.path.join(stamps_folder, f"{script}.json")
+
+def read_stamp(script):
+    """
+    Loads a script's stamp, or None if it is missing or unreadable.
+    """
+    try:
+        with open(stamp_path(script), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def write_stamp(script, state):
+    """
+    Writes a script's stamp through a temporary file, so an interrupted write never leaves a partial stamp.
+    """
+    os.makedirs(stamps_folder, exist_ok=True)
+    temp_path = stamp_path(script) + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(temp_path, stamp_path(script))
+
+def pipeline_is_fresh():
+    """
+    Checks every script against its stamp, stopping at the first stale one.
+    
+    Returns:
+        bool: True if no script, input or output changed since the last successful run.
+    """
+    fresh = all(script in stage_paths and read_stamp(script) == stage_state(script) for script in scripts)
+    save_hash_cache()
+    return fresh
+
 def run_script(script_path):
     """
-    Executes a Python script located at script_path.
+    Executes a Python script located at script_path in a separate Python process.
+    The script's output streams straight to this process's console while it runs.
     
     Args:
         script_path (str): The full path to the Python script to execute.
@@ -31,30 +272,194 @@ def run_script(script_path):
         subprocess.CalledProcessError: If the script execution fails.
     """
     try:
-        # Run the script using subprocess and wait for it to complete
-        result = subprocess.run(["python", script_path], check=True, capture_output=True, text=True)
-        
-        # Output the script's stdout and stderr for debugging purposes
-        print(f"Output from {script_path}:\n{result.stdout}")
-        if result.stderr:
-            print(f"Errors from {script_path}:\n{result.stderr}")
+        # Run the script unbuffered (-u) so its output shows up as it is written, and wait for it to complete.
+        # sys.executable is the interpreter running this workflow, so there is no PATH lookup and no
+        # chance of picking up a different Python without the pipeline's packages
+        subprocess.run([sys.executable, "-u", script_path], check=True, shell=False)
         
-        print(f"Successfully completed: {script_path}")
+        logger.info("Successfully completed: %s", script_path)
     except subprocess.CalledProcessError as e:
-        print(f"Error while running {script_path}: {e}")
-        print(f"Return Code: {e.returncode}")
-        print(f"Output: {e.output}")
-        print(f"Error Output: {e.stderr}")
+        # The script's own error output has already been printed above
+        logger.error("Error while running %s: return code %s", script_path, e.returncode)
+        raise
+
+def init_worker(log_queue, module_names):
+    """
+    Pipeline worker initializer: sends workflow messages to the main process's listener, and imports
+    heavy libraries once, so every script the worker runs finds them already in sys.modules.
+    
+    Args:
+        log_queue (multiprocessing.Queue): The queue drained by the main process's QueueListener.
+        module_names (list): Names of the modules to import.
+    """
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(log_queue))
+    
+    for module_name in module_names:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            # Leave it to the script that needs the module to report it; a failing initializer would break the pool
+            logger.warning("Could not preimport %s: %s", module_name, e)
+
+def start_logging():
+    """
+    Routes workflow messages through a queue to a background listener thread that writes them to the console.
+    
+    Returns:
+        tuple: The log queue (for workers) and the started QueueListener (to stop at exit).
+    """
+    # Same start method as the pipeline workers that receive it
+    log_queue = multiprocessing.get_context("spawn").Queue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(log_queue))
+    return log_queue, listener
+
+def reset_root_logging():
+    """
+    Puts the root logger back in the state a fresh interpreter starts with: no handlers, level WARNING.
+    Scripts configure it themselves (basicConfig at import, or setup_logging only when no handler
+    exists yet), so whatever an earlier script in this worker set up must not carry over.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.WARNING)
+
+def run_stage(script):
+    """
+    Imports the script as a module and calls its main() in the current process, so libraries
+    already imported by earlier stages are reused instead of loaded again by a new process.
+    
+    Args:
+        script (str): The script's file name inside scripts_folder.
+    
+    Raises:
+        Exception: Whatever the script's main() raises.
+    """
+    try:
+        # Reset before the import, since several scripts configure logging at module level
+        reset_root_logging()
+        module = importlib.import_module(os.path.splitext(script)[0])
+        module.main()
+        logger.info("Successfully completed: %s", script)
+    except Exception as e:
+        logger.error("Error while running %s: %s", script, e)
         raise
 
+def run_if_stale(script, script_path, isolated=False):
+    """
+    Runs a script unless its stamp shows that it, its inputs and its outputs are unchanged since
+    its last successful run, then writes a new stamp.
+    
+    Args:
+        script (str): The script's file name inside scripts_folder.
+        script_path (str): The full path to the script.
+        isolated (bool): Run the script in its own Python process instead of importing it.
+    
+    Returns:
+        bool: True if the script ran, False if it was skipped.
+    """
+    if script in stage_paths and read_stamp(script) == stage_state(script):
+        logger.info("Skipping %s: up to date", script)
+        save_hash_cache()
+        return False
+    
+    logger.info("Running script: %s", script)
+    if isolated:
+        run_script(script_path)
+    else:
+        run_stage(script)
+    
+    # Stamp the state after the run: scripts 1 and 2 modify their input folder in place
+    if script in stage_paths:
+        write_stamp(script, stage_state(script))
+    for earlier in restamp_after.get(script, []):
+        # Only scripts that have run before; a missing stamp still means the script has never run
+        if read_stamp(earlier) is not None:
+            write_stamp(earlier, stage_state(earlier))
+    save_hash_cache()
+    return True
+
+def run_pipeline(log_queue, isolated=False, safety_delay=0):
+    """
+    Runs every script as soon as the scripts it depends on have finished, skipping up-to-date ones.
+    
+    Args:
+        log_queue (multiprocessing.Queue): The queue workers send their workflow messages to.
+        isolated (bool): Run each script in its own Python process instead of importing it.
+        safety_delay (float): Seconds to wait after a script finishes before starting the ones that depend on it.
+    
+    Raises:
+        FileNotFoundError: If any script is missing; checked before anything runs.
+        Exception: The first error raised by a script; scripts already running are allowed to finish.
+    """
+    # Resolve every script up front: a script missing halfway through would leave the data half processed
+    script_paths = {script: os.path.join(scripts_folder, script) for script in scripts}
+    missing = [script_path for script_path in script_paths.values() if not os.path.isfile(script_path)]
+    if missing:
+        raise FileNotFoundError(f"Scripts not found: {missing}")
+
+    pending = list(scripts)
+    finished = set()
+    running = {}
+
+    # Isolated scripts get their own interpreters, so preimporting in the workers would be wasted
+    module_names = [] if isolated else preimport_modules
+
+    # Worker processes are not daemonic, so scripts can still start their own process pools.
+    # Workers live for the whole run; in-process scripts find the heavy libraries already imported.
+    # The scripts form a chain, so one worker is enough and only one copy of the libraries is loaded.
+    # Spawn rather than fork: the log listener thread is already running, and a forked child can
+    # inherit its locks held
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_worker, initargs=(log_queue, module_names)) as executor:
+        while pending or running:
+            ready = [script for script in pending
+                     if all(dependency in finished for dependency in stage_dependencies.get(script, []))]
+            if not ready and not running:
+                raise RuntimeError(f"Scripts with unmet dependencies: {pending}")
+
+            # The worker checks the script's stamp itself, so the main process never hashes data folders
+            for script in ready:
+                pending.remove(script)
+                running[executor.submit(run_if_stale, script, script_paths[script], isolated)] = script
+
+            # The future's result is the barrier between a script and the scripts that depend on it
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                script = running.pop(future)
+                future.result()
+                finished.add(script)
+
+            # Off by default: a finished future already means the script's files are written and closed
+            if safety_delay:
+                time.sleep(safety_delay)
+
 if __name__ == "__main__":
-    for script in scripts:
-        script_path = os.path.join(scripts_folder, script)
-        
-        # Check if the script file exists before running it
-        if os.path.exists(script_path):
-            print(f"Running script: {script}")
-            run_script(script_path)
-            time.sleep(1)  # Add a small delay between scripts for safety
+    parser = argparse.ArgumentParser(description="Run the data processing scripts in order.")
+    parser.add_argument("--isolated", action="store_true",
+                        help="Run each script in its own Python process instead of importing it into a pipeline worker")
+    parser.add_argument("--safety-delay", type=float, default=0,
+                        help="Seconds to wait after each script before starting the next (default: 0)")
+    args = parser.parse_args()
+
+    # Make the scripts importable as modules
+    sys.path.insert(0, scripts_folder)
+
+    log_queue, listener = start_logging()
+    try:
+        # Nothing changed since the last run: exit without starting any worker process
+        if pipeline_is_fresh():
+            logger.info("Pipeline up to date")
         else:
-            print(f"Script not found: {script_path}")
+            run_pipeline(log_queue, isolated=args.isolated, safety_delay=args.safety_delay)
+    finally:
+        # Flush everything still queued before the process exits
+        listener.stop()